@@ -1,20 +1,126 @@
 import os
+import re
+import io
+import csv
+import json
+import gzip
+import zlib
+import mmap
+import marshal
+import struct
+import gc
+import math
 import requests
+from requests.adapters import HTTPAdapter
 import hmac
 import hashlib
-from flask import Flask, Response, request, jsonify, render_template_string, session, redirect, url_for
+import heapq
+import itertools
+from flask import Flask, Response, request, jsonify, render_template_string, session, redirect, url_for, send_file
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
 import time
+import random
 import threading
 import logging
+import logging.handlers
+import queue
+import atexit
+import contextvars
+import tracemalloc
 from functools import wraps
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Configure logging: records are queued on the request thread and written by a listener thread
+log_context = contextvars.ContextVar('log_context', default={})  # update_id, chat_id, handler of the current update
+# While a message or inline query is handled, its first outgoing call can ride back in the webhook response
+reply_slot = contextvars.ContextVar('reply_slot', default=None)  # {"open": ..., "call": ...} for the current update
+
+class JSONLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "context", {}))
+        if hasattr(record, "duration_ms"):
+            entry["duration_ms"] = record.duration_ms
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The queue is in-process, so message formatting is left to the listener thread
+        record.context = log_context.get()
+        return record
+
+class SamplingFilter(logging.Filter):
+    # Records logged with extra={"sample_rate": r} are kept with probability r
+    def filter(self, record):
+        return random.random() < getattr(record, "sample_rate", 1.0)
+
+log_queue = queue.SimpleQueue()
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(JSONLogFormatter())
+log_listener = logging.handlers.QueueListener(log_queue, _log_output, respect_handler_level=True)
+_log_handler = DeferredQueueHandler(log_queue)
+_log_handler.addFilter(SamplingFilter())
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
+WEBHOOK_LOG_SAMPLE_RATE = float(os.getenv('WEBHOOK_LOG_SAMPLE_RATE', 0.01))  # Share of handled updates logged
+
+# JSON codec: orjson when installed, stdlib otherwise
+if orjson:
+    def json_dumps(obj):
+        return orjson.dumps(obj)
+
+    def json_loads(data):
+        return orjson.loads(data)
+else:
+    def json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+    def json_loads(data):
+        return json.loads(data)
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify always passes separators (indent in debug); these map onto orjson options
+    ORJSON_KWARGS = {"separators", "indent", "sort_keys", "ensure_ascii"}
+
+    def dumps(self, obj, **kwargs):
+        if orjson and kwargs.keys() <= self.ORJSON_KWARGS:
+            option = orjson.OPT_NON_STR_KEYS
+            if kwargs.get("indent"):
+                option |= orjson.OPT_INDENT_2
+            if kwargs.get("sort_keys", self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
 
 # Flask application
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')  # For sessions
 
 # Bot configuration
@@ -22,16 +128,115 @@ TOKEN = os.getenv('TOKEN')
 if not TOKEN:
     raise ValueError("Bot token is not set in environment variables! Set 'TOKEN' in Vercel settings.")
 CHANNEL_USERNAME = '@cdntelegraph'  # Channel username
-BASE_API_URL = f"https://api.telegram.org/bot{TOKEN}"
+# Storage channel pool; uploads are spread across these to multiply the per-chat flood limit
+STORAGE_CHANNELS = [c.strip() for c in os.getenv('STORAGE_CHANNELS', CHANNEL_USERNAME).split(',') if c.strip()]
+# Registry keys are (channel index << CHANNEL_KEY_SHIFT) | message_id, so the first channel keeps plain message ids
+CHANNEL_KEY_SHIFT = 40
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token; derived from the token unless set explicitly
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or hmac.new(TOKEN.encode(), b"webhook", hashlib.sha256).hexdigest()
+# Telegram only accepts 1-256 characters from this set as secret_token
+WEBHOOK_SECRET_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
+MAX_UPDATE_BYTES = 256 * 1024  # Largest webhook body accepted before JSON decoding
 ADMIN_IDS = [6099917788]  # Replace with your admin user IDs
-MAX_FILE_SIZE_MB = 4000  # Maximum file size in MB
+MAX_FILE_SIZE_MB = 2000  # Maximum file size in MB (Telegram's limit for re-sending by file_id)
+MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024  # Same limit in bytes
+TYPE_MAX_FILE_SIZE = {"photo": 10 * 1024 * 1024}  # Per-type limits in bytes, checked before any API call
+USER_QUOTA = int(os.getenv('USER_QUOTA_MB', 10240)) * 1024 * 1024  # Per-user storage quota in bytes
 RATE_LIMIT = 3  # Files per minute per user
 BOT_USERNAME = "IP_AdressBot"  # Your bot's username
+MYFILES_PAGE_SIZE = 10  # Files per page in /myfiles
+INLINE_PAGE_SIZE = 20  # Results per answerInlineQuery page (Telegram allows up to 50)
+INLINE_CACHE_TIME = 30  # Seconds Telegram may cache inline answers
+MAX_INDEX_TOKENS = 32  # Caption words indexed per file
+DEFAULT_BOT = "default"  # Key of the bot configured by TOKEN, served at /webhook
+DELETE_BATCH_SIZE = 100  # Max message ids per deleteMessages call
+EXPORT_CHUNK_SIZE = 1000  # Registry keys read per files_lock hold during a full export
+STATIC_CACHE_CONTROL = "public, max-age=3600, s-maxage=31536000, stale-while-revalidate=86400"  # Edge cache is purged on deploy
+FAVICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'favicon.ico')
+CRON_SECRET = os.getenv('CRON_SECRET')  # Sent by Vercel Cron as a Bearer token
+
+# Retention policy (days); per-user overrides win over per-type, None keeps files forever
+def parse_retention_days(value):
+    # Expiry is opt-in: unset, empty or "none" keeps files forever
+    if value is None or value.strip().lower() in ["", "none"]:
+        return None
+    days = int(value)
+    if days <= 0:
+        raise ValueError("RETENTION_DAYS must be a positive number of days or 'none'")
+    return days
+
+DEFAULT_RETENTION_DAYS = parse_retention_days(os.getenv('RETENTION_DAYS'))
+TYPE_RETENTION_DAYS = {}  # e.g. {"voice": 7}
+USER_RETENTION_DAYS = {}  # e.g. {6099917788: None}
+EXPIRY_RETRY_SECONDS = 3600  # Delay before retrying a failed expiry delete
+ACTIVITY_SWEEP_SECONDS = 60  # How often idle users and old taps are dropped from user_activity and recent_callbacks
+CALLBACK_DEBOUNCE_SECONDS = 1.5  # Repeated taps on the same button within this window are dropped
+ADMIN_EVENT_QUEUE_SIZE = 1000  # Events buffered per admin page before a slow client is dropped
+ADMIN_EVENT_KEEPALIVE = 15  # Seconds between SSE keepalive comments
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 32))  # Keep-alive connections to the Bot API shared by all bots
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')  # Warm-restart snapshot on storage shared by all instances; unset disables snapshots
+MEMORY_TRACE = os.getenv('MEMORY_TRACE') == '1'  # Enable tracemalloc for /admin/memory
+METRIC_RESOLUTIONS = {"minute": (60, 60), "hour": (3600, 48), "day": (86400, 90)}  # name -> (bucket seconds, buckets kept)
+HLL_PRECISION = 10  # 2**10 one-byte registers per bucket, ~3% error on distinct uploader counts
+
+if MEMORY_TRACE:
+    tracemalloc.start(25)
+
+# Hosted bots: the TOKEN bot plus any from BOTS, a JSON object such as
+# {"mirror": {"token": "...", "username": "MirrorBot", "admin_ids": [1], "channels": ["@mirror_cdn"]}}
+def load_bots():
+    bots = {DEFAULT_BOT: {"token": TOKEN, "username": BOT_USERNAME, "admin_ids": ADMIN_IDS, "channels": STORAGE_CHANNELS, "webhook_secret": WEBHOOK_SECRET}}
+    bots.update(json.loads(os.getenv('BOTS') or '{}'))
+    for key, config in bots.items():
+        config["key"] = key
+        config["api_url"] = f"https://api.telegram.org/bot{config['token']}"
+        config.setdefault("username", BOT_USERNAME)
+        config.setdefault("admin_ids", ADMIN_IDS)
+        config.setdefault("channels", STORAGE_CHANNELS)
+        config.setdefault("webhook_secret", hmac.new(config["token"].encode(), b"webhook", hashlib.sha256).hexdigest())
+        if not WEBHOOK_SECRET_PATTERN.fullmatch(config["webhook_secret"]):
+            raise ValueError(f"Webhook secret for bot '{key}' must be 1-256 characters of A-Z, a-z, 0-9, _ or -")
+    return bots
+
+BOTS = load_bots()
+# Every bot's channels share one index space so registry keys stay unique across bots
+CHANNEL_POOL = list(dict.fromkeys(channel for config in BOTS.values() for channel in config["channels"]))
+current_bot = contextvars.ContextVar('current_bot', default=BOTS[DEFAULT_BOT])
+
+def bot():
+    return current_bot.get()
+
+def with_bot(bot_key, func, *args):
+    token = current_bot.set(BOTS.get(bot_key, BOTS[DEFAULT_BOT]))
+    try:
+        return func(*args)
+    finally:
+        current_bot.reset(token)
+
+# One pooled HTTP session for all bots and threads
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
 
 # User data and file storage (in memory for simplicity; use a database in production)
+files_lock = threading.Lock()  # Guards multi-step registry updates
 uploaded_files = {}
+user_files = {}  # user_id -> {channel_message_id: None}, kept in upload order
+unique_files = {}  # file_unique_id -> channel_message_id, for deduplicating re-uploads
+expiry_heap = []  # (expires_at, channel_message_id), stale entries are skipped on pop
+user_storage = {}  # user_id -> bytes referenced, charged to every owner of a post
+storage_stats = {"bytes": 0}  # Bytes stored in the channel, each post counted once
+bot_storage = {}  # bot key -> {"files": ..., "bytes": ...} for posts that bot stored
+search_index = {}  # token -> {channel_message_id: None} in upload order, for inline search
 user_activity = {}
-users = {}
+channel_posts = {}  # channel -> timestamps of posts in the last minute, for least-loaded placement
+activity_sweep = {"last": 0.0}  # When user_activity was last swept of idle users
+bot_stats = {}  # bot key -> {"updates": ..., "rejected_secret": ..., "rejected_size": ...}
+markup_cache = {}  # menu key -> reply_markup serialized once
+recent_callbacks = {}  # (user_id, message_id, data) -> time of the last accepted tap
+admin_subscribers = []  # One queue.Queue per connected /admin/events stream
+static_pages = {}  # page name -> {"etag": ..., "identity": ..., "gzip": ..., "br": ...}
+metrics_lock = threading.Lock()
+upload_metrics = {}  # bot key -> {resolution: ring}, see new_metric_rings
 
 # Helper functions
 def login_required(f):
@@ -54,6 +259,13 @@ def create_inline_keyboard(buttons, columns=2):
         keyboard.append(row)
     return {"inline_keyboard": keyboard}
 
+def cached_markup(key, buttons, columns=2):
+    # Telegram accepts reply_markup as a JSON string, so fixed menus are encoded only once
+    markup = markup_cache.get(key)
+    if markup is None:
+        markup = markup_cache[key] = json_dumps(create_inline_keyboard(buttons, columns)).decode('utf-8')
+    return markup
+
 def create_reply_keyboard(buttons, resize=True, one_time=False):
     keyboard = []
     row = []
@@ -67,9 +279,29 @@ def create_reply_keyboard(buttons, resize=True, one_time=False):
         "selective": True
     }
 
+def defer_to_reply(method, payload):
+    slot = reply_slot.get()
+    if slot is None or not slot["open"]:
+        return False
+    if slot["call"] is None:
+        slot["call"] = dict(payload, method=method)
+        return True
+    # A second call means the handler needs more than the response can carry; send the held one first to keep order
+    flush_reply(slot)
+    return False
+
+def flush_reply(slot):
+    call, slot["call"], slot["open"] = slot["call"], None, False
+    if call:
+        method = call.pop("method")
+        try:
+            http.post(f"{bot()['api_url']}/{method}", data=json_dumps(call), headers=JSON_HEADERS, timeout=30)
+        except Exception as e:
+            logger.error("Error sending deferred %s: %s", method, e)
+
 def send_message(chat_id, text, reply_markup=None, disable_web_page_preview=True):
     try:
-        url = f"{BASE_API_URL}/sendMessage"
+        url = f"{bot()['api_url']}/sendMessage"
         payload = {
             "chat_id": chat_id,
             "text": text,
@@ -78,16 +310,18 @@ def send_message(chat_id, text, reply_markup=None, disable_web_page_preview=True
         }
         if reply_markup:
             payload["reply_markup"] = reply_markup
-        response = requests.post(url, json=payload, timeout=30)
+        if defer_to_reply("sendMessage", payload):
+            return {"ok": True}
+        response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
         response.raise_for_status()
-        return response.json()
+        return json_loads(response.content)
     except Exception as e:
-        logger.error(f"Error sending message: {e}")
+        logger.error("Error sending message: %s", e)
         return None
 
 def edit_message_text(chat_id, message_id, text, reply_markup=None):
     try:
-        url = f"{BASE_API_URL}/editMessageText"
+        url = f"{bot()['api_url']}/editMessageText"
         payload = {
             "chat_id": chat_id,
             "message_id": message_id,
@@ -96,11 +330,13 @@ def edit_message_text(chat_id, message_id, text, reply_markup=None):
         }
         if reply_markup:
             payload["reply_markup"] = reply_markup
-        response = requests.post(url, json=payload, timeout=30)
+        if defer_to_reply("editMessageText", payload):
+            return {"ok": True}
+        response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
         response.raise_for_status()
-        return response.json()
+        return json_loads(response.content)
     except Exception as e:
-        logger.error(f"Error editing message: {e}")
+        logger.error("Error editing message: %s", e)
         return None
 
 def send_file_to_channel(file_id, file_type, caption=None, chat_id=CHANNEL_USERNAME):
@@ -116,33 +352,132 @@ def send_file_to_channel(file_id, file_type, caption=None, chat_id=CHANNEL_USERN
         return None
 
     method, payload_key = methods[file_type]
-    url = f"{BASE_API_URL}/{method}"
+    url = f"{bot()['api_url']}/{method}"
     payload = {"chat_id": chat_id, payload_key: file_id}
     if caption:
         payload["caption"] = caption
         payload["parse_mode"] = "HTML"
-    response = requests.post(url, json=payload, timeout=30)
+    response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
     response.raise_for_status()
-    return response.json()
+    return json_loads(response.content)
 
 def delete_message(chat_id, message_id):
-    url = f"{BASE_API_URL}/deleteMessage"
+    url = f"{bot()['api_url']}/deleteMessage"
     payload = {"chat_id": chat_id, "message_id": message_id}
-    response = requests.post(url, json=payload, timeout=30)
+    response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
     return response.status_code == 200
 
+def make_file_key(channel_index, message_id):
+    return (channel_index << CHANNEL_KEY_SHIFT) | message_id
+
+def file_location(channel_message_id):
+    channel_index = channel_message_id >> CHANNEL_KEY_SHIFT
+    message_id = channel_message_id & ((1 << CHANNEL_KEY_SHIFT) - 1)
+    file_data = uploaded_files.get(channel_message_id)
+    channel = file_data["channel"] if file_data and "channel" in file_data else CHANNEL_POOL[channel_index]
+    return channel, message_id
+
+def file_url(channel_message_id):
+    channel, message_id = file_location(channel_message_id)
+    return f"https://t.me/{channel[1:]}/{message_id}"
+
+def pick_channel():
+    now = time.time()
+    loads = []
+    for channel in bot()["channels"]:
+        channel_index = CHANNEL_POOL.index(channel)
+        recent = [t for t in channel_posts.get(channel, []) if now - t < 60]
+        channel_posts[channel] = recent
+        loads.append((len(recent), channel_index))
+    return min(loads)[1]
+
+def file_bot(channel_message_id):
+    return uploaded_files.get(channel_message_id, {}).get("bot", DEFAULT_BOT)
+
+def bot_files(keys):
+    # file_id values only work for the bot that stored the file, so listings stay per bot
+    bot_key = bot()["key"]
+    return [key for key in keys if file_bot(key) == bot_key]
+
+def delete_file_message(channel_message_id):
+    # Deletes go through the bot that posted the file, since only it is sure to be a channel admin
+    channel, message_id = file_location(channel_message_id)
+    return with_bot(file_bot(channel_message_id), delete_message, channel, message_id)
+
+def delete_files(channel_message_ids):
+    by_channel = {}
+    for key in channel_message_ids:
+        channel, message_id = file_location(key)
+        by_channel.setdefault((file_bot(key), channel), {})[message_id] = key
+    deleted = []
+    for (bot_key, channel), keys in by_channel.items():
+        deleted.extend(keys[message_id] for message_id in with_bot(bot_key, delete_messages, channel, list(keys)))
+    return deleted
+
+def delete_messages(chat_id, message_ids):
+    deleted = []
+    for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        batch = message_ids[i:i + DELETE_BATCH_SIZE]
+        url = f"{bot()['api_url']}/deleteMessages"
+        payload = {"chat_id": chat_id, "message_ids": batch}
+        try:
+            response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
+            if response.status_code == 200:
+                deleted.extend(batch)
+        except Exception as e:
+            logger.error("Error deleting messages: %s", e)
+    return deleted
+
+def answer_inline_query(inline_query_id, results, next_offset="", is_personal=False):
+    url = f"{bot()['api_url']}/answerInlineQuery"
+    payload = {
+        "inline_query_id": inline_query_id,
+        "results": results,
+        "cache_time": INLINE_CACHE_TIME,
+        "is_personal": is_personal,
+        "next_offset": next_offset
+    }
+    if defer_to_reply("answerInlineQuery", payload):
+        return True
+    try:
+        response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
+        return response.status_code == 200
+    except Exception as e:
+        logger.error("Error answering inline query: %s", e)
+        return False
+
+def answer_callback_query(callback_query_id, text=None):
+    # Sent directly rather than in the webhook reply, for actions that take a while
+    url = f"{bot()['api_url']}/answerCallbackQuery"
+    payload = {"callback_query_id": callback_query_id}
+    if text:
+        payload["text"] = text
+    try:
+        response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
+        return response.status_code == 200
+    except Exception as e:
+        logger.error("Error answering callback query: %s", e)
+        return False
+
 def get_user_info(user_id):
-    url = f"{BASE_API_URL}/getChat"
+    url = f"{bot()['api_url']}/getChat"
     payload = {"chat_id": user_id}
-    response = requests.post(url, json=payload, timeout=30)
+    response = http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
     if response.status_code == 200:
-        return response.json().get("result", {})
+        return json_loads(response.content).get("result", {})
     return {}
 
 def send_typing_action(chat_id):
-    url = f"{BASE_API_URL}/sendChatAction"
+    url = f"{bot()['api_url']}/sendChatAction"
     payload = {"chat_id": chat_id, "action": "typing"}
-    requests.post(url, json=payload, timeout=30)
+    http.post(url, data=json_dumps(payload), headers=JSON_HEADERS, timeout=30)
+
+def format_size(num_bytes):
+    for unit in ["B", "KB", "MB"]:
+        if num_bytes < 1024:
+            return f"{num_bytes} B" if unit == "B" else f"{num_bytes:.2f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} GB"
 
 def create_file_info_message(file_data, channel_url):
     file_type_emoji = {
@@ -164,61 +499,525 @@ def create_file_info_message(file_data, channel_url):
 
 👤 <b>Uploaded by:</b> {first_name} (@{username})
 📅 <b>Upload time:</b> {upload_time}
-📏 <b>File size:</b> {file_data.get('file_size', 'N/A')} MB
+📏 <b>File size:</b> {format_size(file_data.get('file_size', 0))}
 
 🔗 <b>Channel URL:</b> <a href="{channel_url}">Click here to view</a>
 
 <i>You can delete this file using the button below.</i>
 """
 
+def prune_activity(now):
+    for key in list(user_activity.keys()):
+        user_activity[key] = [t for t in user_activity[key] if now - t < 60]
+        if not user_activity[key]:
+            del user_activity[key]
+    for key, tapped_at in list(recent_callbacks.items()):
+        if now - tapped_at >= CALLBACK_DEBOUNCE_SECONDS:
+            del recent_callbacks[key]
+    activity_sweep["last"] = now
+
 def check_rate_limit(user_id):
+    # Limits are tracked per bot, so heavy use of one bot doesn't throttle another
+    key = (bot()["key"], user_id)
     now = time.time()
-    if user_id not in user_activity:
-        user_activity[user_id] = []
+    # Serverless instances may never run the background sweep, so idle users are dropped here too
+    if now - activity_sweep["last"] > ACTIVITY_SWEEP_SECONDS:
+        prune_activity(now)
+    if key not in user_activity:
+        user_activity[key] = []
     
-    user_activity[user_id] = [t for t in user_activity[user_id] if now - t < 60]
+    user_activity[key] = [t for t in user_activity[key] if now - t < 60]
     
-    if len(user_activity[user_id]) >= RATE_LIMIT:
+    if len(user_activity[key]) >= RATE_LIMIT:
         return False
     
-    user_activity[user_id].append(now)
+    user_activity[key].append(now)
+    return True
+
+def retention_days(user_id, file_type):
+    if user_id in USER_RETENTION_DAYS:
+        return USER_RETENTION_DAYS[user_id]
+    return TYPE_RETENTION_DAYS.get(file_type, DEFAULT_RETENTION_DAYS)
+
+def schedule_expiry(channel_message_id, user_id):
+    file_data = uploaded_files[channel_message_id]
+    days = retention_days(user_id, file_data["file_type"])
+    expires_at = None if days is None else time.time() + days * 86400
+    current = file_data.get("expires_at", 0)
+    # Shared posts live as long as their longest-retained owner needs them
+    if current is None or (expires_at is not None and expires_at <= current):
+        return
+    file_data["expires_at"] = expires_at
+    if expires_at is not None:
+        heapq.heappush(expiry_heap, (expires_at, channel_message_id))
+
+def _charge_storage(user_id, num_bytes):
+    used = user_storage.get(user_id, 0) + num_bytes
+    if used > 0:
+        user_storage[user_id] = used
+    else:
+        user_storage.pop(user_id, None)
+
+def publish_admin_event(event, data):
+    if not admin_subscribers:
+        return
+    data["stats"] = {"files": len(uploaded_files), "bytes": storage_stats["bytes"], "storage": format_size(storage_stats["bytes"])}
+    message = f"event: {event}\ndata: {json_dumps(data).decode('utf-8')}\n\n"
+    for subscriber in list(admin_subscribers):
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            drop_admin_subscriber(subscriber)
+
+def drop_admin_subscriber(subscriber):
+    # Publishers on several threads and the stream's own cleanup may all try to drop the same queue
+    try:
+        admin_subscribers.remove(subscriber)
+    except ValueError:
+        pass
+
+def tokenize(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+def file_tokens(file_data):
+    tokens = set(tokenize(file_data.get("caption"))[:MAX_INDEX_TOKENS])
+    tokens.add(file_data["file_type"])
+    tokens.add(str(file_data["user_id"]))
+    if file_data.get("username"):
+        tokens.add(file_data["username"].lower())
+    return tokens
+
+def _count_bot_file(file_data, sign):
+    counters = bot_storage.setdefault(file_data.get("bot", DEFAULT_BOT), {"files": 0, "bytes": 0})
+    counters["files"] += sign
+    counters["bytes"] += sign * file_data["file_size"]
+
+def register_file(channel_message_id, file_data):
+    file_data["owners"] = {file_data["user_id"]}
+    uploaded_files[channel_message_id] = file_data
+    user_files.setdefault(file_data["user_id"], {})[channel_message_id] = None
+    _charge_storage(file_data["user_id"], file_data["file_size"])
+    storage_stats["bytes"] += file_data["file_size"]
+    _count_bot_file(file_data, 1)
+    if file_data.get("file_unique_id"):
+        unique_files[file_data["file_unique_id"]] = channel_message_id
+    for token in file_tokens(file_data):
+        search_index.setdefault(token, {})[channel_message_id] = None
+    schedule_expiry(channel_message_id, file_data["user_id"])
+    publish_admin_event("upload", {
+        "key": channel_message_id,
+        "file_type": file_data["file_type"],
+        "user_id": file_data["user_id"],
+        "channel": file_data.get("channel"),
+        "size": format_size(file_data["file_size"]),
+        "uploaded_at": datetime.fromtimestamp(file_data["timestamp"]).strftime('%Y-%m-%d %H:%M:%S'),
+        "url": file_url(channel_message_id)
+    })
+
+def add_file_owner(channel_message_id, user_id):
+    file_data = uploaded_files[channel_message_id]
+    if user_id not in file_data["owners"]:
+        file_data["owners"].add(user_id)
+        _charge_storage(user_id, file_data["file_size"])
+    user_files.setdefault(user_id, {})[channel_message_id] = None
+    schedule_expiry(channel_message_id, user_id)
+
+def _drop_user_file(user_id, channel_message_id):
+    owned = user_files.get(user_id)
+    if owned is not None:
+        owned.pop(channel_message_id, None)
+        if not owned:
+            del user_files[user_id]
+
+def release_file(channel_message_id, user_id):
+    # Returns True if other users still reference the channel post
+    file_data = uploaded_files[channel_message_id]
+    if len(file_data["owners"]) <= 1:
+        return False
+    if user_id in file_data["owners"]:
+        file_data["owners"].discard(user_id)
+        _charge_storage(user_id, -file_data["file_size"])
+    _drop_user_file(user_id, channel_message_id)
     return True
 
+def unregister_file(channel_message_id):
+    file_data = uploaded_files.pop(channel_message_id, None)
+    if file_data is None:
+        return None
+    for owner_id in file_data["owners"]:
+        _drop_user_file(owner_id, channel_message_id)
+        _charge_storage(owner_id, -file_data["file_size"])
+    storage_stats["bytes"] -= file_data["file_size"]
+    _count_bot_file(file_data, -1)
+    if unique_files.get(file_data.get("file_unique_id")) == channel_message_id:
+        del unique_files[file_data["file_unique_id"]]
+    for token in file_tokens(file_data):
+        postings = search_index.get(token)
+        if postings is not None:
+            postings.pop(channel_message_id, None)
+            if not postings:
+                del search_index[token]
+    publish_admin_event("delete", {"key": channel_message_id})
+    if len(expiry_heap) > 2 * len(uploaded_files) + 1024:
+        expiry_heap[:] = [(t, m) for t, m in expiry_heap if uploaded_files.get(m, {}).get("expires_at") == t]
+        heapq.heapify(expiry_heap)
+    return file_data
+
+def search_files(query, offset=0, limit=INLINE_PAGE_SIZE):
+    # Walks the rarest term's postings newest-first and stops once the page is full
+    postings = []
+    for token in set(tokenize(query)):
+        if token not in search_index:
+            return []
+        postings.append(search_index[token])
+    if not postings:
+        return []
+    postings.sort(key=len)
+    rarest, rest = postings[0], postings[1:]
+    bot_key = bot()["key"]
+    matches = []
+    for key in reversed(rarest):
+        if all(key in other for other in rest) and file_bot(key) == bot_key:
+            matches.append(key)
+            if len(matches) >= offset + limit:
+                break
+    return matches[offset:]
+
+def select_files(user_id=None, file_type=None, older_than=None, min_size=None, max_size=None):
+    candidates = user_files.get(user_id, {}) if user_id is not None else uploaded_files
+    selected = []
+    for msg_id in list(candidates):
+        file_data = uploaded_files.get(msg_id)
+        if file_data is None:
+            continue
+        if file_type and file_data["file_type"] != file_type:
+            continue
+        if older_than is not None and file_data["timestamp"] >= older_than:
+            continue
+        if min_size is not None and file_data.get("file_size", 0) < min_size:
+            continue
+        if max_size is not None and file_data.get("file_size", 0) > max_size:
+            continue
+        selected.append(msg_id)
+    return selected
+
+def registry_chunks(chunk_size=EXPORT_CHUNK_SIZE):
+    # Walks uploaded_files a chunk at a time under files_lock rather than copying every key up
+    # front. Uploads land at the end of the dict, so after the registry changes between chunks the
+    # walk resumes after the newest key of the last chunk that is still registered
+    keys = iter(uploaded_files)
+    position = 0
+    previous = []
+    while True:
+        with files_lock:
+            try:
+                chunk = list(itertools.islice(keys, chunk_size))
+            except RuntimeError:
+                anchor = next((key for key in reversed(previous) if key in uploaded_files), None)
+                keys = iter(uploaded_files)
+                if anchor is not None:
+                    for key in keys:
+                        if key == anchor:
+                            break
+                else:
+                    # The whole last chunk was deleted meanwhile: fall back to resuming by position
+                    keys = itertools.islice(keys, max(position - len(previous), 0), None)
+                chunk = list(itertools.islice(keys, chunk_size))
+        if not chunk:
+            return
+        position += len(chunk)
+        previous = chunk
+        yield chunk
+
+def iter_files(user_id=None, file_type=None, since=None, until=None):
+    # A user's own files are few, so those keys are copied; a full export walks the registry in chunks
+    if user_id is not None:
+        chunks = [list(user_files.get(user_id, {}))]
+    else:
+        chunks = registry_chunks()
+    for chunk in chunks:
+        for msg_id in chunk:
+            file_data = uploaded_files.get(msg_id)
+            if file_data is None:
+                continue
+            if file_type and file_data["file_type"] != file_type:
+                continue
+            if since is not None and file_data["timestamp"] < since:
+                continue
+            if until is not None and file_data["timestamp"] >= until:
+                continue
+            yield msg_id, file_data
+
+def clear_files():
+    # Only the current bot's posts: an admin of one hosted bot must not wipe another bot's storage.
+    # Posts are deleted from the channel first; any that fail stay registered and keep their expiry
+    with files_lock:
+        keys = bot_files(uploaded_files)
+    deleted = delete_files(keys)
+    with files_lock:
+        for msg_id in deleted:
+            unregister_file(msg_id)
+    return len(keys), len(deleted)
+
+def expire_files(now=None):
+    now = now or time.time()
+    expired = []
+    with files_lock:
+        while expiry_heap and expiry_heap[0][0] <= now:
+            expires_at, msg_id = heapq.heappop(expiry_heap)
+            if uploaded_files.get(msg_id, {}).get("expires_at") == expires_at:
+                expired.append(msg_id)
+    deleted = delete_files(expired)
+    with files_lock:
+        for msg_id in deleted:
+            unregister_file(msg_id)
+        for msg_id in set(expired) - set(deleted):
+            if msg_id in uploaded_files:
+                retry_at = now + EXPIRY_RETRY_SECONDS
+                uploaded_files[msg_id]["expires_at"] = retry_at
+                heapq.heappush(expiry_heap, (retry_at, msg_id))
+    return len(expired), len(deleted)
+
+# Upload metrics
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+HLL_POWERS = [2.0 ** -rank for rank in range(65)]
+
+def hll_position(user_id):
+    value = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), 'big')
+    remainder = value & ((1 << (64 - HLL_PRECISION)) - 1)
+    return value >> (64 - HLL_PRECISION), 64 - HLL_PRECISION - remainder.bit_length() + 1
+
+def hll_count(registers):
+    zeros = registers.count(0)
+    if zeros == len(registers):
+        return 0
+    estimate = HLL_ALPHA * len(registers) ** 2 / sum(map(HLL_POWERS.__getitem__, registers))
+    if estimate <= 2.5 * len(registers) and zeros:
+        estimate = len(registers) * math.log(len(registers) / zeros)
+    return round(estimate)
+
+def new_metric_rings():
+    # Ring buffers sized once: slot = period % buckets, reused when its period comes round again.
+    # "users" holds each slot's HyperLogLog registers back to back in one bytearray.
+    return {
+        name: {"periods": [-1] * buckets, "uploads": [0] * buckets, "bytes": [0] * buckets, "users": bytearray(buckets << HLL_PRECISION)}
+        for name, (width, buckets) in METRIC_RESOLUTIONS.items()
+    }
+
+def metric_slot(ring, period):
+    slot = period % len(ring["periods"])
+    if ring["periods"][slot] > period:
+        return None  # Older than the window this slot now covers
+    if ring["periods"][slot] != period:
+        ring["periods"][slot] = period
+        ring["uploads"][slot] = 0
+        ring["bytes"][slot] = 0
+        ring["users"][slot * HLL_REGISTERS:(slot + 1) * HLL_REGISTERS] = bytes(HLL_REGISTERS)
+    return slot
+
+def record_upload(user_id, num_bytes, now=None):
+    now = now or time.time()
+    register, rank = hll_position(user_id)
+    with metrics_lock:
+        rings = upload_metrics.get(bot()["key"])
+        if rings is None:
+            rings = upload_metrics[bot()["key"]] = new_metric_rings()
+        for name, (width, buckets) in METRIC_RESOLUTIONS.items():
+            ring = rings[name]
+            slot = metric_slot(ring, int(now // width))
+            if slot is None:
+                continue
+            ring["uploads"][slot] += 1
+            ring["bytes"][slot] += num_bytes
+            offset = slot * HLL_REGISTERS + register
+            if ring["users"][offset] < rank:
+                ring["users"][offset] = rank
+
+def upload_series(name, count=None, now=None, bot_key=None):
+    width, buckets = METRIC_RESOLUTIONS[name]
+    count = min(count or buckets, buckets)
+    current = int((now or time.time()) // width)
+    series = []
+    merged = bytearray(HLL_REGISTERS)
+    with metrics_lock:
+        ring = upload_metrics.get(bot_key or bot()["key"], {}).get(name)
+        for period in range(current - count + 1, current + 1):
+            slot = period % buckets
+            bucket = {"start": period * width, "uploads": 0, "bytes": 0, "users": 0}
+            if ring and ring["periods"][slot] == period and ring["uploads"][slot]:
+                registers = ring["users"][slot * HLL_REGISTERS:(slot + 1) * HLL_REGISTERS]
+                merged = bytearray(map(max, merged, registers))
+                bucket.update(uploads=ring["uploads"][slot], bytes=ring["bytes"][slot], users=hll_count(registers))
+            series.append(bucket)
+    totals = {"uploads": sum(b["uploads"] for b in series), "bytes": sum(b["bytes"] for b in series), "users": hll_count(merged)}
+    return series, totals
+
+def restore_metrics(saved):
+    # Rings from a different resolution layout, or of bots no longer hosted, are ignored rather than reshaped
+    with metrics_lock:
+        for bot_key, saved_rings in (saved or {}).items():
+            if bot_key not in BOTS:
+                continue
+            rings = new_metric_rings()
+            for name, (width, buckets) in METRIC_RESOLUTIONS.items():
+                ring = saved_rings.get(name)
+                if not ring or len(ring["periods"]) != buckets or len(ring["users"]) != buckets * HLL_REGISTERS:
+                    continue
+                rings[name] = {"periods": list(ring["periods"]), "uploads": list(ring["uploads"]), "bytes": list(ring["bytes"]), "users": bytearray(ring["users"])}
+            upload_metrics[bot_key] = rings
+
 # Webhook and routes
 @app.route('/setwebhook', methods=['GET', 'POST'])
 def set_webhook():
     vercel_url = os.getenv('VERCEL_URL', 'https://uploadfiletgbot.vercel.app')
-    webhook_url = f"{BASE_API_URL}/setWebhook?url={vercel_url}/webhook&allowed_updates=%5B%22message%22,%22callback_query%22%5D"
-    response = requests.get(webhook_url, timeout=30)
-    if response.status_code == 200:
+    errors = []
+    for key, config in BOTS.items():
+        path = "/webhook" if key == DEFAULT_BOT else f"/webhook/{key}"
+        params = {"url": f"{vercel_url}{path}", "allowed_updates": '["message","callback_query","inline_query"]', "secret_token": config["webhook_secret"]}
+        response = http.get(f"{config['api_url']}/setWebhook", params=params, timeout=30)
+        if response.status_code != 200:
+            errors.append((key, response))
+    if not errors:
         return "Webhook successfully set", 200
-    return f"Error setting webhook: {response.text}", response.status_code
-
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    update = request.get_json()
+    key, response = errors[0]
+    return f"Error setting webhook for {key}: {response.text}", response.status_code
+
+def stats_for(bot_key):
+    return bot_stats.setdefault(bot_key, {"updates": 0, "rejected_secret": 0, "rejected_size": 0})
+
+@app.route('/webhook', methods=['POST'], defaults={'bot_key': DEFAULT_BOT})
+@app.route('/webhook/<bot_key>', methods=['POST'])
+def webhook(bot_key):
+    config = BOTS.get(bot_key)
+    if config is None:
+        return "", 404
+    stats = stats_for(bot_key)
+    # Cheap checks first so junk traffic never reaches JSON decoding
+    # Compared as bytes: compare_digest rejects non-ASCII str, and junk headers must count as a 403
+    if not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode('latin-1'), config["webhook_secret"].encode()):
+        stats["rejected_secret"] += 1
+        return "", 403
+    if request.content_length is None or request.content_length > MAX_UPDATE_BYTES:
+        stats["rejected_size"] += 1
+        return "", 413
+
+    update = request.get_json(silent=True)
     if not update:
         return jsonify({"status": "no data"}), 400
 
+    started = time.perf_counter()
     if "callback_query" in update:
-        handle_callback_query(update["callback_query"])
+        handler = "callback_query"
+        chat_id = update["callback_query"].get("message", {}).get("chat", {}).get("id")
     elif "message" in update:
-        handle_message(update["message"])
-
+        handler = "message"
+        chat_id = update["message"].get("chat", {}).get("id")
+    elif "inline_query" in update:
+        handler = "inline_query"
+        chat_id = update["inline_query"]["from"]["id"]
+    else:
+        handler, chat_id = "ignored", None
+    stats["updates"] += 1
+    token = log_context.set({"bot": bot_key, "update_id": update.get("update_id"), "chat_id": chat_id, "handler": handler})
+    bot_token = current_bot.set(config)
+    slot = {"open": handler != "callback_query", "call": None}
+    slot_token = reply_slot.set(slot)
+    reply = None
+    try:
+        if handler == "callback_query":
+            reply = handle_callback_query(update["callback_query"])
+        elif handler == "message":
+            handle_message(update["message"])
+        elif handler == "inline_query":
+            handle_inline_query(update["inline_query"])
+        slot["open"] = False
+        reply = reply or slot["call"]
+        logger.info("Update handled", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 2), "sample_rate": WEBHOOK_LOG_SAMPLE_RATE})
+    finally:
+        reply_slot.reset(slot_token)
+        current_bot.reset(bot_token)
+        log_context.reset(token)
+
+    if reply:
+        return jsonify(reply), 200
     return jsonify({"status": "processed"}), 200
 
+def is_repeated_tap(user_id, message_id, callback_data):
+    now = time.time()
+    if now - activity_sweep["last"] > ACTIVITY_SWEEP_SECONDS:
+        prune_activity(now)
+    key = (user_id, message_id, callback_data)
+    if now - recent_callbacks.get(key, 0) < CALLBACK_DEBOUNCE_SECONDS:
+        return True
+    recent_callbacks[key] = now
+    return False
+
 def handle_callback_query(callback):
+    # Work always finishes before the webhook returns: the runtime may freeze the instance as
+    # soon as the response is sent. Cheap menu edits return the acknowledgement in the response;
+    # slow actions answer directly first so the button's spinner stops right away
     chat_id = callback["message"]["chat"]["id"]
     message_id = callback["message"]["message_id"]
     user_id = callback["from"]["id"]
     callback_data = callback["data"]
-
+    answer = {"method": "answerCallbackQuery", "callback_query_id": callback["id"]}
+
+    if is_repeated_tap(user_id, message_id, callback_data):
+        return answer
+    deleting = callback_data.startswith("delete_") or callback_data == "purge_mine_confirm"
+    if not deleting and callback_data != "admin_stats":
+        dispatch_callback(chat_id, message_id, user_id, callback_data)
+        return answer
+    answer_callback_query(callback["id"], "⏳ Deleting..." if deleting else None)
+    dispatch_callback(chat_id, message_id, user_id, callback_data)
+    return None
+
+def dispatch_callback(chat_id, message_id, user_id, callback_data):
     if callback_data.startswith("delete_"):
         channel_message_id = int(callback_data.split("_")[1])
         handle_delete(chat_id, message_id, user_id, channel_message_id)
+    elif callback_data.startswith("myfiles_"):
+        show_my_files(chat_id, user_id, int(callback_data.split("_")[1]), message_id)
+    elif callback_data == "purge_mine":
+        confirm_delete_all(chat_id, message_id)
+    elif callback_data == "purge_mine_confirm":
+        handle_delete_all(chat_id, message_id, user_id)
     elif callback_data in ["help", "upload_instructions", "main_menu", "admin_panel", "admin_stats", "admin_list", "admin_users", "admin_restart", "privacy"]:
         handle_menu_action(chat_id, message_id, user_id, callback_data)
 
+def handle_inline_query(inline_query):
+    user_id = inline_query["from"]["id"]
+    query = inline_query.get("query", "").strip()
+    try:
+        offset = int(inline_query.get("offset") or 0)
+    except ValueError:
+        offset = 0
+
+    if query:
+        keys = search_files(query, offset)
+    else:
+        keys = bot_files(reversed(user_files.get(user_id, {})))[offset:offset + INLINE_PAGE_SIZE]
+    results = [result for result in map(create_inline_result, keys) if result]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(keys) == INLINE_PAGE_SIZE else ""
+    answer_inline_query(inline_query["id"], results, next_offset, is_personal=not query)
+
+def create_inline_result(channel_message_id):
+    file_data = uploaded_files.get(channel_message_id)
+    if file_data is None:
+        return None
+    file_type = file_data["file_type"]
+    title = (file_data.get("caption") or f"{file_type.capitalize()} by {file_data.get('username') or file_data['user_id']}")[:64]
+    result = {"type": file_type, "id": str(channel_message_id), f"{file_type}_file_id": file_data["file_id"]}
+    if file_type in ["document", "video", "voice"]:
+        result["title"] = title
+    if file_type in ["document", "video"]:
+        result["description"] = format_size(file_data.get("file_size", 0))
+    if file_data.get("caption"):
+        # Sent as plain text, like the channel post: a caption with "<" or "&" must not fail the whole answer
+        result["caption"] = file_data["caption"]
+    return result
+
 def handle_message(message):
     chat_id = message["chat"]["id"]
     user_id = message["from"]["id"]
@@ -229,22 +1028,26 @@ def handle_message(message):
         handle_file_upload(chat_id, user_id, message)
 
 def handle_text_command(chat_id, user_id, text):
-    send_typing_action(chat_id)
     if text == "/start":
         show_main_menu(chat_id, user_id)
     elif text == "/help":
         show_help(chat_id)
     elif text == "/upload":
         show_upload_instructions(chat_id)
-    elif text == "/stats" and user_id in ADMIN_IDS:
+    elif text == "/myfiles":
+        show_my_files(chat_id, user_id)
+    elif text == "/stats" and user_id in bot()["admin_ids"]:
         show_stats(chat_id)
-    elif text == "/list" and user_id in ADMIN_IDS:
+    elif text == "/list" and user_id in bot()["admin_ids"]:
         list_files(chat_id, user_id)
     elif text == "/privacy":
         show_privacy_policy(chat_id)
-    elif text == "/restart" and user_id in ADMIN_IDS:
-        uploaded_files.clear()
-        send_message(chat_id, "🔄 <b>Bot has been restarted.</b>\n\nAll cached data has been cleared.")
+    elif text == "/restart" and user_id in bot()["admin_ids"]:
+        total, deleted = clear_files()
+        if deleted == total:
+            send_message(chat_id, f"🔄 <b>Bot has been restarted.</b>\n\nAll {total} files stored by this bot have been deleted.")
+        else:
+            send_message(chat_id, f"🔄 <b>Bot has been restarted.</b>\n\nDeleted {deleted} of {total} stored files. The rest are kept and will expire as scheduled.")
     else:
         send_message(chat_id, "❓ <b>Unknown Command</b>\n\nType /help to see available commands.")
 
@@ -253,50 +1056,78 @@ def handle_file_upload(chat_id, user_id, message):
         send_message(chat_id, "⚠️ <b>Rate Limit Exceeded</b>\n\nPlease wait a minute before uploading more files.")
         return
 
-    file_id, file_type, caption, file_size = extract_file_info(message)
-    if file_size > MAX_FILE_SIZE_MB:
-        send_message(chat_id, f"⚠️ <b>File Too Large</b>\n\nMaximum file size is {MAX_FILE_SIZE_MB} MB. Your file is {file_size:.2f} MB.")
+    file_id, file_unique_id, file_type, caption, file_size = extract_file_info(message)
+    max_size = TYPE_MAX_FILE_SIZE.get(file_type, MAX_FILE_SIZE)
+    if file_size > max_size:
+        send_message(chat_id, f"⚠️ <b>File Too Large</b>\n\nMaximum {file_type} size is {format_size(max_size)}. Your file is {format_size(file_size)}.")
+        return
+
+    # Lookup and ownership change happen together so a concurrent delete can't remove the post in between
+    with files_lock:
+        existing_message_id = unique_files.get(file_unique_id)
+        if existing_message_id is not None and file_bot(existing_message_id) != bot()["key"]:
+            existing_message_id = None  # Another bot's post can't be served with this bot's file_id
+        already_owned = existing_message_id is not None and user_id in uploaded_files[existing_message_id]["owners"]
+        used = user_storage.get(user_id, 0)
+        over_quota = not already_owned and used + file_size > USER_QUOTA
+        if existing_message_id is not None and not over_quota:
+            add_file_owner(existing_message_id, user_id)
+            file_data = uploaded_files[existing_message_id]
+    if over_quota:
+        send_message(chat_id, f"⚠️ <b>Storage Quota Exceeded</b>\n\nYou are using {format_size(used)} of {format_size(USER_QUOTA)}. Delete some files with /myfiles and try again.")
+        return
+
+    if existing_message_id is not None:
+        record_upload(user_id, 0)  # Deduplicated: nothing new is written to the channel
+        send_upload_confirmation(chat_id, existing_message_id, file_data)
         return
 
     send_typing_action(chat_id)
-    result = send_file_to_channel(file_id, file_type, caption)
+    channel_index = pick_channel()
+    channel = CHANNEL_POOL[channel_index]
+    result = send_file_to_channel(file_id, file_type, caption, chat_id=channel)
     if result and result.get("ok"):
-        channel_message_id = result["result"]["message_id"]
-        channel_url = f"https://t.me/{CHANNEL_USERNAME[1:]}/{channel_message_id}"
-
-        uploaded_files[channel_message_id] = {
+        channel_posts[channel].append(time.time())
+        channel_message_id = make_file_key(channel_index, result["result"]["message_id"])
+        file_data = {
+            "bot": bot()["key"],
+            "channel": channel,
+            "message_id": result["result"]["message_id"],
             "file_id": file_id,
+            "file_unique_id": file_unique_id,
             "file_type": file_type,
             "user_id": user_id,
+            "username": message["from"].get("username"),
             "timestamp": message["date"],
             "caption": caption,
-            "file_size": round(file_size, 2)
+            "file_size": file_size
         }
-
-        file_info = create_file_info_message(uploaded_files[channel_message_id], channel_url)
-        buttons = [
-            {"text": "🗑️ Delete File", "callback_data": f"delete_{channel_message_id}"},
-            {"text": "🔗 Copy Link", "url": channel_url},
-            {"text": "📤 Upload Another", "callback_data": "upload_instructions"},
-            {"text": "🏠 Main Menu", "callback_data": "main_menu"}
-        ]
-        reply_markup = create_inline_keyboard(buttons)
-        send_message(chat_id, file_info, reply_markup)
+        with files_lock:
+            register_file(channel_message_id, file_data)
+        record_upload(user_id, file_size)
+        send_upload_confirmation(chat_id, channel_message_id, file_data)
     else:
         send_message(chat_id, "❌ <b>Upload Failed</b>\n\nSorry, I couldn't upload your file. Please try again.")
 
+def send_upload_confirmation(chat_id, channel_message_id, file_data):
+    # file_data is passed in: the post may already have been deleted from the registry
+    channel_url = file_url(channel_message_id)
+    file_info = create_file_info_message(file_data, channel_url)
+    buttons = [
+        {"text": "🗑️ Delete File", "callback_data": f"delete_{channel_message_id}"},
+        {"text": "🔗 Copy Link", "url": channel_url},
+        {"text": "📤 Upload Another", "callback_data": "upload_instructions"},
+        {"text": "🏠 Main Menu", "callback_data": "main_menu"}
+    ]
+    reply_markup = create_inline_keyboard(buttons)
+    send_message(chat_id, file_info, reply_markup)
+
 def extract_file_info(message):
-    if "document" in message:
-        return message["document"]["file_id"], "document", message.get("caption"), message["document"].get("file_size", 0) / (1024 * 1024)
-    elif "photo" in message:
-        return message["photo"][-1]["file_id"], "photo", message.get("caption"), message["photo"][-1].get("file_size", 0) / (1024 * 1024)
-    elif "video" in message:
-        return message["video"]["file_id"], "video", message.get("caption"), message["video"].get("file_size", 0) / (1024 * 1024)
-    elif "audio" in message:
-        return message["audio"]["file_id"], "audio", message.get("caption"), message["audio"].get("file_size", 0) / (1024 * 1024)
-    elif "voice" in message:
-        return message["voice"]["file_id"], "voice", message.get("caption"), message["voice"].get("file_size", 0) / (1024 * 1024)
-    return None, None, None, 0
+    for file_type in ["document", "photo", "video", "audio", "voice"]:
+        if file_type in message:
+            media = message[file_type][-1] if file_type == "photo" else message[file_type]
+            return media["file_id"], media.get("file_unique_id"), file_type, message.get("caption"), int(media.get("file_size") or 0)
+    return None, None, None, None, 0
 
 def show_main_menu(chat_id, user_id=None, message_id=None):
     welcome_message = """
@@ -314,13 +1145,14 @@ def show_main_menu(chat_id, user_id=None, message_id=None):
     """
     buttons = [
         {"text": "📤 Upload File", "callback_data": "upload_instructions"},
+        {"text": "📂 My Files", "callback_data": "myfiles_0"},
         {"text": "ℹ️ Help", "callback_data": "help"},
         {"text": "🔒 Privacy Policy", "callback_data": "privacy"}
     ]
-    if user_id and user_id in ADMIN_IDS:
+    if user_id and user_id in bot()["admin_ids"]:
         buttons.append({"text": "🛠️ Admin Panel", "callback_data": "admin_panel"})
     
-    reply_markup = create_inline_keyboard(buttons, columns=2)
+    reply_markup = cached_markup("main_menu_admin" if user_id in bot()["admin_ids"] else "main_menu", buttons, columns=2)
     
     if message_id:
         edit_message_text(chat_id, message_id, welcome_message, reply_markup)
@@ -335,8 +1167,12 @@ def show_help(chat_id, message_id=None):
     /start - Start the bot and get instructions
     /help - Show this help message
     /upload - Learn how to upload files
+    /myfiles - List and manage your files
     /privacy - View our privacy policy
 
+    <b>Search:</b>
+    Type @{bot_username} followed by words from a caption, a file type or an uploader in any chat.
+
     <b>How to use:</b>
     1. Send me a file (document, photo, video, or audio)
     2. I'll automatically upload it to the channel
@@ -350,13 +1186,13 @@ def show_help(chat_id, message_id=None):
     • Support for various file types
     • Rate limiting (max {RATE_LIMIT} files per minute)
     • File size limit ({MAX_FILE_SIZE_MB} MB max)
-    """.format(RATE_LIMIT=RATE_LIMIT, MAX_FILE_SIZE_MB=MAX_FILE_SIZE_MB)
+    """.format(RATE_LIMIT=RATE_LIMIT, MAX_FILE_SIZE_MB=MAX_FILE_SIZE_MB, bot_username=bot()["username"])
     buttons = [
         {"text": "📤 How to Upload", "callback_data": "upload_instructions"},
         {"text": "🔒 Privacy Policy", "callback_data": "privacy"},
         {"text": "🔙 Main Menu", "callback_data": "main_menu"}
     ]
-    reply_markup = create_inline_keyboard(buttons)
+    reply_markup = cached_markup("help", buttons)
     
     if message_id:
         edit_message_text(chat_id, message_id, help_text, reply_markup)
@@ -391,7 +1227,7 @@ def show_upload_instructions(chat_id, message_id=None):
         {"text": "🔙 Main Menu", "callback_data": "main_menu"},
         {"text": "ℹ️ General Help", "callback_data": "help"}
     ]
-    reply_markup = create_inline_keyboard(buttons)
+    reply_markup = cached_markup("upload_instructions", buttons)
     
     if message_id:
         edit_message_text(chat_id, message_id, instructions, reply_markup)
@@ -419,7 +1255,7 @@ def show_privacy_policy(chat_id, message_id=None):
     buttons = [
         {"text": "🔙 Main Menu", "callback_data": "main_menu"}
     ]
-    reply_markup = create_inline_keyboard(buttons)
+    reply_markup = cached_markup("privacy", buttons)
     if message_id:
         edit_message_text(chat_id, message_id, privacy_text, reply_markup)
     else:
@@ -441,7 +1277,7 @@ def show_admin_panel(chat_id, message_id=None):
         {"text": "📜 List Files", "callback_data": "admin_list"},
         {"text": "🔙 Main Menu", "callback_data": "main_menu"}
     ]
-    reply_markup = create_inline_keyboard(buttons, columns=2)
+    reply_markup = cached_markup("admin_panel", buttons, columns=2)
     
     if message_id:
         edit_message_text(chat_id, message_id, admin_text, reply_markup)
@@ -449,18 +1285,31 @@ def show_admin_panel(chat_id, message_id=None):
         send_message(chat_id, admin_text, reply_markup)
 
 def show_stats(chat_id):
-    total_files = len(uploaded_files)
-    active_users = len({v['user_id'] for v in uploaded_files.values()})
-    total_size = sum(v.get('file_size', 0) for v in uploaded_files.values())
+    bot_key = bot()["key"]
+    storage = bot_storage.get(bot_key, {"files": 0, "bytes": 0})
+    total_files = storage["files"]
+    total_size = storage["bytes"]
+    active_users = len(user_files)
+    stats = stats_for(bot_key)
+    _, last_hour = upload_series("minute")
+    _, last_day = upload_series("hour", 24)
+    _, last_month = upload_series("day", 30)
     
     stats_message = f"""
     📊 <b>Bot Statistics</b>
 
-    • Total files uploaded: {total_files}
-    • Active users: {active_users}
-    • Total storage used: {total_size:.2f} MB
+    • Files stored by this bot: {total_files}
+    • Storage used by this bot: {format_size(total_size)} ({total_size} bytes)
+    • Active users (all hosted bots): {active_users}
     • Rate limit: {RATE_LIMIT} files per minute
     • Max file size: {MAX_FILE_SIZE_MB} MB
+    • Updates handled by this bot: {stats['updates']}
+    • Rejected webhook calls: {stats['rejected_secret']} bad secret, {stats['rejected_size']} oversized
+
+    <b>Upload Activity (this bot):</b>
+    • Last hour: {last_hour['uploads']} uploads, {format_size(last_hour['bytes'])}, ~{last_hour['users']} uploaders
+    • Last 24 hours: {last_day['uploads']} uploads, {format_size(last_day['bytes'])}, ~{last_day['users']} uploaders
+    • Last 30 days: {last_month['uploads']} uploads, {format_size(last_month['bytes'])}, ~{last_month['users']} uploaders
 
     <b>System Status:</b>
     The bot is functioning normally.
@@ -469,45 +1318,60 @@ def show_stats(chat_id):
         {"text": "🛠️ Admin Panel", "callback_data": "admin_panel"},
         {"text": "🔙 Main Menu", "callback_data": "main_menu"}
     ]
-    reply_markup = create_inline_keyboard(buttons)
+    reply_markup = cached_markup("admin_stats", buttons)
     send_message(chat_id, stats_message, reply_markup)
 
 def list_files(chat_id, user_id):
-    if user_id not in ADMIN_IDS:
+    if user_id not in bot()["admin_ids"]:
         send_message(chat_id, "⛔ <b>Permission Denied</b>\n\nOnly admins can use this command.")
         return
     
-    if not uploaded_files:
+    # Only this bot's files: getChat must go through the bot the uploader talked to
+    bot_key = bot()["key"]
+    recent = []
+    with files_lock:
+        for msg_id in reversed(uploaded_files):
+            if file_bot(msg_id) == bot_key:
+                recent.append((msg_id, uploaded_files[msg_id]))
+                if len(recent) == 10:
+                    break
+    if not recent:
         send_message(chat_id, "ℹ️ <b>No files uploaded yet.</b>")
         return
+    total = bot_storage.get(bot_key, {"files": 0})["files"]
     
     message = "📜 <b>Recently Uploaded Files</b>\n\n"
-    for i, (msg_id, file_data) in enumerate(list(uploaded_files.items())[-10:], 1):
+    for i, (msg_id, file_data) in enumerate(reversed(recent), 1):
         user_info = get_user_info(file_data["user_id"])
         username = user_info.get("username", "Unknown")
         file_type = file_data["file_type"].capitalize()
         timestamp = datetime.fromtimestamp(file_data["timestamp"]).strftime('%Y-%m-%d %H:%M')
         
         message += f"{i}. <b>{file_type}</b> by @{username}\n"
-        message += f"   📅 {timestamp} | 📏 {file_data.get('file_size', 'N/A')} MB\n"
-        message += f"   🔗 <a href='https://t.me/{CHANNEL_USERNAME[1:]}/{msg_id}'>View File</a>\n\n"
+        message += f"   📅 {timestamp} | 📏 {format_size(file_data.get('file_size', 0))}\n"
+        message += f"   🔗 <a href='{file_url(msg_id)}'>View File</a>\n\n"
     
-    if len(uploaded_files) > 10:
-        message += f"<i>Showing last 10 of {len(uploaded_files)} files</i>"
+    if total > 10:
+        message += f"<i>Showing last 10 of {total} files</i>"
     
     buttons = [
         {"text": "🛠️ Admin Panel", "callback_data": "admin_panel"},
         {"text": "🔙 Main Menu", "callback_data": "main_menu"}
     ]
-    reply_markup = create_inline_keyboard(buttons)
+    reply_markup = cached_markup("admin_list", buttons)
     send_message(chat_id, message, reply_markup)
 
 def handle_delete(chat_id, message_id, user_id, channel_message_id):
-    if channel_message_id in uploaded_files:
-        file_data = uploaded_files[channel_message_id]
-        if user_id in ADMIN_IDS or file_data["user_id"] == user_id:
-            if delete_message(CHANNEL_USERNAME, channel_message_id):
-                del uploaded_files[channel_message_id]
+    with files_lock:
+        file_data = uploaded_files.get(channel_message_id)
+        released = file_data is not None and user_id in file_data["owners"] and release_file(channel_message_id, user_id)
+    if file_data is not None:
+        if released:
+            edit_message_text(chat_id, message_id, "✅ <b>File successfully deleted!</b>", reply_markup=None)
+        elif user_id in bot()["admin_ids"] or user_id in file_data["owners"]:
+            if delete_file_message(channel_message_id):
+                with files_lock:
+                    unregister_file(channel_message_id)
                 edit_message_text(chat_id, message_id, "✅ <b>File successfully deleted!</b>", reply_markup=None)
             else:
                 edit_message_text(chat_id, message_id, "❌ <b>Failed to delete the file.</b>\n\nPlease try again.", reply_markup=create_inline_keyboard([{"text": "Try Again", "callback_data": f"delete_{channel_message_id}"}]))
@@ -516,43 +1380,231 @@ def handle_delete(chat_id, message_id, user_id, channel_message_id):
     else:
         edit_message_text(chat_id, message_id, "⚠️ <b>File not found</b>\n\nThis file may have already been deleted.", reply_markup=None)
 
+def show_my_files(chat_id, user_id, page=0, message_id=None):
+    owned = bot_files(user_files.get(user_id, {}))
+    if not owned:
+        text = "ℹ️ <b>You have no uploaded files.</b>"
+        buttons = [{"text": "📤 Upload File", "callback_data": "upload_instructions"}, {"text": "🏠 Main Menu", "callback_data": "main_menu"}]
+        if message_id:
+            edit_message_text(chat_id, message_id, text, create_inline_keyboard(buttons))
+        else:
+            send_message(chat_id, text, create_inline_keyboard(buttons))
+        return
+
+    owned.reverse()
+    pages = (len(owned) + MYFILES_PAGE_SIZE - 1) // MYFILES_PAGE_SIZE
+    page = max(0, min(page, pages - 1))
+    start = page * MYFILES_PAGE_SIZE
+
+    text = f"📂 <b>Your Files</b> ({len(owned)} total)\n\n"
+    for i, msg_id in enumerate(owned[start:start + MYFILES_PAGE_SIZE], start + 1):
+        file_data = uploaded_files[msg_id]
+        timestamp = datetime.fromtimestamp(file_data["timestamp"]).strftime('%Y-%m-%d %H:%M')
+        text += f"{i}. <b>{file_data['file_type'].capitalize()}</b> | 📅 {timestamp} | 📏 {format_size(file_data.get('file_size', 0))}\n"
+        text += f"   🔗 <a href='{file_url(msg_id)}'>View File</a>\n\n"
+    text += f"<i>Page {page + 1} of {pages}</i>"
+
+    nav = []
+    if page > 0:
+        nav.append({"text": "⬅️ Previous", "callback_data": f"myfiles_{page - 1}"})
+    if page < pages - 1:
+        nav.append({"text": "Next ➡️", "callback_data": f"myfiles_{page + 1}"})
+    keyboard = [nav] if nav else []
+    keyboard.append([{"text": "🗑️ Delete All My Files", "callback_data": "purge_mine"}])
+    keyboard.append([{"text": "🏠 Main Menu", "callback_data": "main_menu"}])
+    reply_markup = {"inline_keyboard": keyboard}
+
+    if message_id:
+        edit_message_text(chat_id, message_id, text, reply_markup)
+    else:
+        send_message(chat_id, text, reply_markup)
+
+def confirm_delete_all(chat_id, message_id):
+    buttons = [
+        {"text": "✅ Yes, delete all", "callback_data": "purge_mine_confirm"},
+        {"text": "❌ Cancel", "callback_data": "myfiles_0"}
+    ]
+    edit_message_text(chat_id, message_id, "⚠️ <b>Delete all your files?</b>\n\nThis cannot be undone.", create_inline_keyboard(buttons))
+
+def handle_delete_all(chat_id, message_id, user_id):
+    with files_lock:
+        owned = bot_files(user_files.get(user_id, {}))
+        sole = [msg_id for msg_id in owned if not release_file(msg_id, user_id)]
+    if not owned:
+        edit_message_text(chat_id, message_id, "ℹ️ <b>You have no uploaded files.</b>", reply_markup=None)
+        return
+    deleted = delete_files(sole)
+    with files_lock:
+        for msg_id in deleted:
+            unregister_file(msg_id)
+    removed = len(owned) - len(sole) + len(deleted)
+    if removed == len(owned):
+        edit_message_text(chat_id, message_id, f"✅ <b>Deleted {removed} files.</b>", reply_markup=None)
+    else:
+        edit_message_text(chat_id, message_id, f"⚠️ <b>Deleted {removed} of {len(owned)} files.</b>\n\nPlease try again.", reply_markup=create_inline_keyboard([{"text": "Try Again", "callback_data": "purge_mine_confirm"}]))
+
 def handle_menu_action(chat_id, message_id, user_id, action):
     if action == "help":
         show_help(chat_id, message_id)
     elif action == "upload_instructions":
         show_upload_instructions(chat_id, message_id)
     elif action == "main_menu":
-        show_main_menu(chat_id, message_id, user_id)
+        show_main_menu(chat_id, user_id, message_id)
     elif action == "privacy":
         show_privacy_policy(chat_id, message_id)
-    elif action == "admin_panel" and user_id in ADMIN_IDS:
+    elif action == "admin_panel" and user_id in bot()["admin_ids"]:
         show_admin_panel(chat_id, message_id)
-    elif action == "admin_stats" and user_id in ADMIN_IDS:
+    elif action == "admin_stats" and user_id in bot()["admin_ids"]:
         show_stats(chat_id)
-    elif action == "admin_list" and user_id in ADMIN_IDS:
+    elif action == "admin_list" and user_id in bot()["admin_ids"]:
         list_files(chat_id, user_id)
 
 # Background task
 def clean_activity_data():
     while True:
-        now = time.time()
-        for user_id in list(user_activity.keys()):
-            user_activity[user_id] = [t for t in user_activity[user_id] if now - t < 120]
-            if not user_activity[user_id]:
-                del user_activity[user_id]
+        prune_activity(time.time())
         time.sleep(3600)
 
 cleaner_thread = threading.Thread(target=clean_activity_data, daemon=True)
 cleaner_thread.start()
 
+# State snapshots: header (magic, format version, marshal version, payload length, crc32) + marshal payload
+SNAPSHOT_MAGIC = b"TGUS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHBxQI")
+SNAPSHOT_STATE = {
+    "uploaded_files": uploaded_files,
+    "user_files": user_files,
+    "unique_files": unique_files,
+    "user_storage": user_storage,
+    "storage_stats": storage_stats,
+    "search_index": search_index,
+    "user_activity": user_activity,
+    "channel_posts": channel_posts,
+    "bot_stats": bot_stats
+}  # markup_cache is left out: it is built from code and must follow the deployed menus
+snapshot_ready = threading.Event()
+
+def _snapshot_copy(value):
+    # Containers and the dicts/lists they hold (file records, postings, per-user indexes) are copied so
+    # the snapshot is consistent; deeper values such as owner sets are shared
+    if isinstance(value, dict):
+        return {key: item.copy() if isinstance(item, (dict, list)) else item for key, item in value.items()}
+    return list(value)
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    # Only the copy holds the locks; encoding and writing run without blocking uploads and deletes
+    with files_lock:
+        state = {name: _snapshot_copy(target) for name, target in SNAPSHOT_STATE.items()}
+        state["expiry_heap"] = list(expiry_heap)
+    with metrics_lock:
+        state["upload_metrics"] = {bot_key: {name: {field: values[:] for field, values in ring.items()} for name, ring in rings.items()} for bot_key, rings in upload_metrics.items()}
+    payload = marshal.dumps(state)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, marshal.version, len(payload), zlib.crc32(payload))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return len(header) + len(payload)
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    # Millions of new containers would otherwise trigger repeated full GC passes while decoding
+    gc.disable()
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < SNAPSHOT_HEADER.size:
+                raise ValueError("snapshot is truncated")
+            magic, version, marshal_version, length, checksum = SNAPSHOT_HEADER.unpack_from(mapped)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or marshal_version != marshal.version:
+                raise ValueError("snapshot format is not supported")
+            with memoryview(mapped)[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length] as payload:
+                if len(payload) != length or zlib.crc32(payload) != checksum:
+                    raise ValueError("snapshot checksum mismatch")
+                state = marshal.loads(payload)
+        with files_lock:
+            for name, target in SNAPSHOT_STATE.items():
+                target.clear()
+                target.update(state.get(name, {}))
+            expiry_heap[:] = state.get("expiry_heap", [])
+            heapq.heapify(expiry_heap)
+            bot_storage.clear()
+            for file_data in uploaded_files.values():
+                _count_bot_file(file_data, 1)
+        restore_metrics(state.get("upload_metrics"))
+        del state
+        gc.freeze()  # Restored state is long-lived; keep it out of future collections
+    finally:
+        gc.enable()
+    return len(uploaded_files)
+
+def restore_snapshot():
+    try:
+        if SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+            started = time.perf_counter()
+            count = load_snapshot()
+            logger.info("Snapshot restored: %d files in %.1f ms", count, (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        logger.error("Error restoring snapshot: %s", e)
+    finally:
+        snapshot_ready.set()
+
+@app.before_request
+def wait_for_snapshot():
+    # Decoding runs in the background during cold start; static pages never wait for it
+    if request.endpoint not in ["home", "privacy_policy", "favicon"]:
+        snapshot_ready.wait(timeout=10)
+
+threading.Thread(target=restore_snapshot, daemon=True).start()
+
+# Static page cache
+def build_static_page(template, **context):
+    body = render_template_string(template, **context).encode('utf-8')
+    page = {
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0)
+    }
+    if brotli:
+        page["br"] = brotli.compress(body, quality=11)
+    return page
+
+def serve_static_page(name, template, **context):
+    page = static_pages.get(name)
+    if page is None:
+        page = static_pages[name] = build_static_page(template, **context)
+
+    if page["etag"] in request.if_none_match:
+        response = Response(status=304)
+    else:
+        encoding = "identity"
+        if "br" in page and request.accept_encodings["br"]:
+            encoding = "br"
+        elif request.accept_encodings["gzip"]:
+            encoding = "gzip"
+        response = Response(page[encoding], mimetype='text/html')
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(page["etag"])
+    response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
 # Web Routes
 @app.route('/', methods=['GET'])
 def home():
-    return render_template_string(HOME_HTML, bot_username=BOT_USERNAME, privacy_policy_url='/privacy')
+    return serve_static_page("home", HOME_HTML, bot_username=BOT_USERNAME, privacy_policy_url='/privacy')
 
 @app.route('/privacy', methods=['GET'])
 def privacy_policy():
-    return render_template_string(PRIVACY_HTML)
+    return serve_static_page("privacy", PRIVACY_HTML)
+
+@app.route('/favicon.ico', methods=['GET'])
+def favicon():
+    # Vercel serves the root favicon.ico directly; this covers local runs
+    response = send_file(FAVICON_PATH, mimetype='image/vnd.microsoft.icon', conditional=True, etag=True)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
 
 @app.route('/admin', methods=['GET'])
 @login_required
@@ -560,7 +1612,7 @@ def admin_panel():
     user_id = session.get('user_id')
     if user_id not in ADMIN_IDS:
         return "Access denied", 403
-    return render_template_string(ADMIN_HTML, uploaded_files=uploaded_files, CHANNEL_USERNAME=CHANNEL_USERNAME)
+    return render_template_string(ADMIN_HTML, uploaded_files=uploaded_files, storage=format_size(storage_stats["bytes"]), file_url=file_url, datetime=datetime, format_size=format_size)
 
 @app.route('/delete_file/<int:msg_id>', methods=['POST'])
 @login_required
@@ -568,11 +1620,236 @@ def delete_file(msg_id):
     user_id = session.get('user_id')
     if user_id not in ADMIN_IDS:
         return jsonify({"status": "error", "message": "Access denied"}), 403
-    if msg_id in uploaded_files and delete_message(CHANNEL_USERNAME, msg_id):
-        del uploaded_files[msg_id]
+    if msg_id in uploaded_files and delete_file_message(msg_id):
+        with files_lock:
+            unregister_file(msg_id)
         return jsonify({"status": "success", "message": "File deleted"}), 200
     return jsonify({"status": "error", "message": "File not found or deletion failed"}), 404
 
+@app.route('/admin/bulk_delete', methods=['POST'])
+@login_required
+def bulk_delete():
+    user_id = session.get('user_id')
+    if user_id not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    data = request.get_json(silent=True) or {}
+
+    if "ids" in data:
+        try:
+            msg_ids = [msg_id for msg_id in map(int, data["ids"]) if msg_id in uploaded_files]
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "ids must be a list of message ids"}), 400
+    else:
+        filters = data.get("filter") or {}
+        if not filters:
+            return jsonify({"status": "error", "message": "Provide ids or a filter"}), 400
+        try:
+            older_than = time.time() - float(filters["older_than_days"]) * 86400 if "older_than_days" in filters else None
+            msg_ids = select_files(
+                user_id=int(filters["user_id"]) if "user_id" in filters else None,
+                file_type=filters.get("file_type"),
+                older_than=older_than,
+                min_size=int(float(filters["min_size_mb"]) * 1024 * 1024) if "min_size_mb" in filters else None,
+                max_size=int(float(filters["max_size_mb"]) * 1024 * 1024) if "max_size_mb" in filters else None
+            )
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "Invalid filter"}), 400
+
+    def generate():
+        deleted = []
+        try:
+            yield json_dumps({"status": "started", "total": len(msg_ids)}) + b"\n"
+            for i in range(0, len(msg_ids), DELETE_BATCH_SIZE):
+                batch = msg_ids[i:i + DELETE_BATCH_SIZE]
+                done = delete_files(batch)
+                deleted.extend(done)
+                yield json_dumps({"status": "progress", "processed": i + len(batch), "deleted": done}) + b"\n"
+        finally:
+            with files_lock:
+                for msg_id in deleted:
+                    unregister_file(msg_id)
+        yield json_dumps({"status": "done", "total": len(msg_ids), "deleted": len(deleted)}) + b"\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+EXPORT_FIELDS = ["key", "channel", "message_id", "url", "file_type", "user_id", "username", "owners", "timestamp", "file_size", "caption", "file_unique_id", "expires_at"]
+
+def export_row(msg_id, file_data):
+    channel, message_id = file_location(msg_id)
+    return {
+        "key": msg_id,
+        "channel": channel,
+        "message_id": message_id,
+        "url": file_url(msg_id),
+        "file_type": file_data["file_type"],
+        "user_id": file_data["user_id"],
+        "username": file_data.get("username"),
+        "owners": len(file_data.get("owners", ())),
+        "timestamp": file_data["timestamp"],
+        "file_size": file_data.get("file_size", 0),
+        "caption": file_data.get("caption"),
+        "file_unique_id": file_data.get("file_unique_id"),
+        "expires_at": file_data.get("expires_at")
+    }
+
+def parse_date_arg(value, end_of_day=False):
+    # Unix timestamps are taken as-is; a YYYY-MM-DD upper bound covers that whole day
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    day = datetime.strptime(value, '%Y-%m-%d')
+    return (day + timedelta(days=1) if end_of_day else day).timestamp()
+
+@app.route('/admin/export', methods=['GET'])
+@login_required
+def export_files():
+    user_id = session.get('user_id')
+    if user_id not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    export_format = request.args.get('format', 'jsonl')
+    if export_format not in ["jsonl", "csv"]:
+        return jsonify({"status": "error", "message": "format must be jsonl or csv"}), 400
+    try:
+        rows = iter_files(
+            user_id=int(request.args['user_id']) if request.args.get('user_id') else None,
+            file_type=request.args.get('type'),
+            since=parse_date_arg(request.args.get('from')),
+            until=parse_date_arg(request.args.get('to'), end_of_day=True)
+        )
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid filter"}), 400
+    compress = request.args.get('gzip') == '1'
+
+    def encode():
+        if export_format == "jsonl":
+            for msg_id, file_data in rows:
+                yield json_dumps(export_row(msg_id, file_data)) + b"\n"
+            return
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for msg_id, file_data in rows:
+            writer.writerow(export_row(msg_id, file_data))
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def generate():
+        if not compress:
+            yield from encode()
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+        for chunk in encode():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    filename = f"files-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}" + (".gz" if compress else "")
+    mimetype = 'application/gzip' if compress else ('text/csv' if export_format == "csv" else 'application/x-ndjson')
+    response = Response(generate(), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+@app.route('/admin/events', methods=['GET'])
+@login_required
+def admin_events():
+    user_id = session.get('user_id')
+    if user_id not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    subscriber = queue.Queue(maxsize=ADMIN_EVENT_QUEUE_SIZE)
+    admin_subscribers.append(subscriber)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=ADMIN_EVENT_KEEPALIVE)
+                except queue.Empty:
+                    if subscriber not in admin_subscribers:
+                        return
+                    yield ": keepalive\n\n"
+        finally:
+            drop_admin_subscriber(subscriber)
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/admin/memory', methods=['GET'])
+@login_required
+def memory_report():
+    user_id = session.get('user_id')
+    if user_id not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    report = {
+        "uploaded_files": len(uploaded_files),
+        "user_files": len(user_files),
+        "unique_files": len(unique_files),
+        "expiry_heap": len(expiry_heap),
+        "user_storage": len(user_storage),
+        "user_activity": len(user_activity),
+        "markup_cache": len(markup_cache),
+        "tracing": tracemalloc.is_tracing()
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        report.update({
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "top_allocations": [{"location": str(stat.traceback), "bytes": stat.size, "count": stat.count} for stat in top]
+        })
+    return jsonify(report), 200
+
+@app.route('/admin/metrics', methods=['GET'])
+@login_required
+def upload_metrics_report():
+    user_id = session.get('user_id')
+    if user_id not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    resolution = request.args.get('resolution', 'minute')
+    if resolution not in METRIC_RESOLUTIONS:
+        return jsonify({"status": "error", "message": f"resolution must be one of {', '.join(METRIC_RESOLUTIONS)}"}), 400
+    try:
+        count = int(request.args.get('buckets', 0))
+    except ValueError:
+        return jsonify({"status": "error", "message": "buckets must be an integer"}), 400
+    bot_key = request.args.get('bot', DEFAULT_BOT)
+    if bot_key not in BOTS:
+        return jsonify({"status": "error", "message": f"bot must be one of {', '.join(BOTS)}"}), 400
+    series, totals = upload_series(resolution, max(count, 0), bot_key=bot_key)
+    return jsonify({"bot": bot_key, "resolution": resolution, "bucket_seconds": METRIC_RESOLUTIONS[resolution][0], "buckets": series, "totals": totals}), 200
+
+def cron_authorized():
+    return bool(CRON_SECRET) and hmac.compare_digest(request.headers.get('Authorization', '').encode('latin-1'), f"Bearer {CRON_SECRET}".encode())
+
+@app.route('/cron/expire', methods=['GET', 'POST'])
+def cron_expire():
+    if not cron_authorized():
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    expired, deleted = expire_files()
+    return jsonify({"status": "success", "expired": expired, "deleted": deleted}), 200
+
+@app.route('/cron/snapshot', methods=['GET', 'POST'])
+def cron_snapshot():
+    if not cron_authorized() and session.get('user_id') not in ADMIN_IDS:
+        return jsonify({"status": "error", "message": "Access denied"}), 403
+    if not SNAPSHOT_PATH:
+        # A per-instance /tmp file would never be seen by the next cold start
+        return jsonify({"status": "disabled", "message": "Set SNAPSHOT_PATH to shared durable storage to enable snapshots"}), 409
+    try:
+        size = write_snapshot()
+    except OSError as e:
+        logger.error("Error writing snapshot: %s", e)
+        return jsonify({"status": "error", "message": "Snapshot failed"}), 500
+    return jsonify({"status": "success", "bytes": size, "files": len(uploaded_files)}), 200
+
 # HTML Templates as Strings
 HOME_HTML = """
 <!DOCTYPE html>
@@ -581,11 +1858,10 @@ HOME_HTML = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Telegram File Uploader Bot</title>
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap" rel="stylesheet">
     <style>
         :root { --primary-color: #4361ee; --secondary-color: #3f37c9; --accent-color: #4895ef; --dark-color: #2b2d42; --light-color: #f8f9fa; --success-color: #4cc9f0; --danger-color: #f72585; --warning-color: #f8961e; }
         * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: 'Poppins', sans-serif; line-height: 1.6; color: var(--dark-color); background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); min-height: 100vh; padding: 2rem; }
+        body { font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; line-height: 1.6; color: var(--dark-color); background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); min-height: 100vh; padding: 2rem; }
         .container { max-width: 1200px; margin: 0 auto; padding: 2rem; background-color: white; border-radius: 15px; box-shadow: 0 10px 30px rgba(0, 0, 0, 0.1); position: relative; overflow: hidden; }
         .container::before { content: ''; position: absolute; top: 0; left: 0; width: 100%; height: 10px; background: linear-gradient(90deg, var(--primary-color), var(--accent-color)); }
         header { text-align: center; margin-bottom: 3rem; }
@@ -659,7 +1935,6 @@ PRIVACY_HTML = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Privacy Policy - Telegram File Uploader Bot</title>
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap" rel="stylesheet">
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">
     <style>
         :root {
@@ -681,7 +1956,7 @@ PRIVACY_HTML = """
         }
 
         body {
-            font-family: 'Poppins', sans-serif;
+            font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif;
             line-height: 1.6;
             color: var(--text-color);
             background: linear-gradient(135deg, #e3f2fd 0%, #f5f7fa 100%);
@@ -1059,52 +2334,177 @@ ADMIN_HTML = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Admin Panel</title>
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap" rel="stylesheet">
     <style>
-        body { background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); font-family: 'Poppins', sans-serif; padding: 2rem; }
+        body { background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; padding: 2rem; }
         .container { max-width: 1200px; margin: 0 auto; background: white; padding: 2rem; border-radius: 15px; box-shadow: 0 10px 30px rgba(0, 0, 0, 0.1); }
         h1 { color: #4361ee; margin-bottom: 1rem; }
         .file-list { margin-top: 2rem; }
         .file-item { border-bottom: 1px solid #eee; padding: 1rem 0; }
         .btn { display: inline-block; padding: 0.8rem 1.5rem; background: #4361ee; color: white; border-radius: 50px; text-decoration: none; margin: 0.5rem; }
         .btn:hover { background: #3f37c9; }
+        .bulk-bar { display: flex; flex-wrap: wrap; gap: 0.5rem; align-items: center; margin-top: 1rem; }
+        .bulk-bar input, .bulk-bar select { padding: 0.5rem; border: 1px solid #ddd; border-radius: 8px; font-family: inherit; }
+        #bulk-progress { margin-top: 0.5rem; color: #555; }
     </style>
 </head>
 <body>
     <div class="container">
         <h1>Admin Panel</h1>
         <p>Manage uploaded files, users, and bot settings.</p>
+        <p><strong>Files:</strong> <span id="stat-files">{{ uploaded_files|length }}</span> | <strong>Storage:</strong> <span id="stat-storage">{{ storage }}</span></p>
+
+        <div class="bulk-bar">
+            <label><input type="checkbox" id="select-all" onchange="toggleAll(this.checked)"> Select all</label>
+            <a href="#" class="btn" onclick="deleteSelected()">Delete Selected</a>
+        </div>
+        <div class="bulk-bar">
+            <input type="number" id="filter-user" placeholder="User ID">
+            <select id="filter-type">
+                <option value="">Any type</option>
+                <option value="document">Document</option>
+                <option value="photo">Photo</option>
+                <option value="video">Video</option>
+                <option value="audio">Audio</option>
+                <option value="voice">Voice</option>
+            </select>
+            <input type="number" id="filter-age" placeholder="Older than (days)">
+            <input type="number" id="filter-size" placeholder="Larger than (MB)">
+            <a href="#" class="btn" onclick="deleteFiltered()">Delete Matching</a>
+        </div>
+        <p id="bulk-progress"></p>
 
-        <div class="file-list">
+        <div class="file-list" id="file-list">
             <h2>Uploaded Files</h2>
             {% for msg_id, file_data in uploaded_files.items() %}
-                <div class="file-item">
+                <div class="file-item" id="file-{{ msg_id }}">
+                    <p><input type="checkbox" class="file-select" value="{{ msg_id }}"></p>
                     <p><strong>File Type:</strong> {{ file_data.file_type|capitalize }}</p>
                     <p><strong>Uploaded By:</strong> User ID {{ file_data.user_id }}</p>
-                    <p><strong>Size:</strong> {{ file_data.file_size }} MB</p>
+                    <p><strong>Channel:</strong> {{ file_data.channel }}</p>
+                    <p><strong>Size:</strong> {{ format_size(file_data.file_size) }}</p>
                     <p><strong>Uploaded At:</strong> {{ datetime.fromtimestamp(file_data.timestamp).strftime('%Y-%m-%d %H:%M:%S') }}</p>
-                    <a href="https://t.me/{{ CHANNEL_USERNAME[1:] }}/{{ msg_id }}" class="btn">View File</a>
+                    <a href="{{ file_url(msg_id) }}" class="btn">View File</a>
                     <a href="#" class="btn" onclick="deleteFile({{ msg_id }})">Delete</a>
                 </div>
             {% endfor %}
         </div>
 
+        <template id="file-template">
+            <div class="file-item">
+                <p><input type="checkbox" class="file-select"></p>
+                <p><strong>File Type:</strong> <span class="f-type"></span></p>
+                <p><strong>Uploaded By:</strong> User ID <span class="f-user"></span></p>
+                <p><strong>Channel:</strong> <span class="f-channel"></span></p>
+                <p><strong>Size:</strong> <span class="f-size"></span></p>
+                <p><strong>Uploaded At:</strong> <span class="f-time"></span></p>
+                <a class="btn f-view">View File</a>
+                <a href="#" class="btn f-delete">Delete</a>
+            </div>
+        </template>
+
+        <a href="/admin/export?format=jsonl&gzip=1" class="btn">Export JSONL</a>
+        <a href="/admin/export?format=csv" class="btn">Export CSV</a>
         <a href="/" class="btn">Back to Home</a>
     </div>
 
     <script>
         function deleteFile(msg_id) {
             if (confirm("Are you sure you want to delete this file?")) {
-                fetch('/delete_file/' + msg_id, { method: 'POST' })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            alert('File deleted successfully!');
-                            location.reload();
-                        } else {
-                            alert('Failed to delete file.');
-                        }
-                    });
+                bulkDelete({ ids: [msg_id] });
+            }
+        }
+
+        function toggleAll(checked) {
+            document.querySelectorAll('.file-select').forEach(box => { box.checked = checked; });
+        }
+
+        function deleteSelected() {
+            const ids = Array.from(document.querySelectorAll('.file-select:checked')).map(box => Number(box.value));
+            if (ids.length && confirm('Delete ' + ids.length + ' selected files?')) {
+                bulkDelete({ ids: ids });
+            }
+        }
+
+        function deleteFiltered() {
+            const filter = {};
+            const user = document.getElementById('filter-user').value;
+            const type = document.getElementById('filter-type').value;
+            const age = document.getElementById('filter-age').value;
+            const size = document.getElementById('filter-size').value;
+            if (user) filter.user_id = Number(user);
+            if (type) filter.file_type = type;
+            if (age) filter.older_than_days = Number(age);
+            if (size) filter.min_size_mb = Number(size);
+            if (Object.keys(filter).length && confirm('Delete all files matching this filter?')) {
+                bulkDelete({ filter: filter });
+            }
+        }
+
+        function updateStats(stats) {
+            document.getElementById('stat-files').textContent = stats.files;
+            document.getElementById('stat-storage').textContent = stats.storage;
+        }
+
+        function addFileItem(file) {
+            if (document.getElementById('file-' + file.key)) return;
+            const item = document.getElementById('file-template').content.firstElementChild.cloneNode(true);
+            item.id = 'file-' + file.key;
+            item.querySelector('.file-select').value = file.key;
+            item.querySelector('.f-type').textContent = file.file_type.charAt(0).toUpperCase() + file.file_type.slice(1);
+            item.querySelector('.f-user').textContent = file.user_id;
+            item.querySelector('.f-channel').textContent = file.channel;
+            item.querySelector('.f-size').textContent = file.size;
+            item.querySelector('.f-time').textContent = file.uploaded_at;
+            item.querySelector('.f-view').href = file.url;
+            item.querySelector('.f-delete').onclick = () => deleteFile(file.key);
+            document.getElementById('file-list').appendChild(item);
+        }
+
+        const events = new EventSource('/admin/events');
+        events.addEventListener('upload', event => {
+            const data = JSON.parse(event.data);
+            addFileItem(data);
+            updateStats(data.stats);
+        });
+        events.addEventListener('delete', event => {
+            const data = JSON.parse(event.data);
+            const item = document.getElementById('file-' + data.key);
+            if (item) item.remove();
+            updateStats(data.stats);
+        });
+
+        async function bulkDelete(body) {
+            const progress = document.getElementById('bulk-progress');
+            const response = await fetch('/admin/bulk_delete', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body)
+            });
+            if (!response.ok) {
+                alert('Failed to delete files.');
+                return;
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\\n');
+                buffer = lines.pop();
+                lines.filter(line => line).forEach(line => {
+                    const event = JSON.parse(line);
+                    if (event.status === 'progress') {
+                        event.deleted.forEach(id => {
+                            const item = document.getElementById('file-' + id);
+                            if (item) item.remove();
+                        });
+                        progress.textContent = 'Processed ' + event.processed + ' files...';
+                    } else if (event.status === 'done') {
+                        progress.textContent = 'Deleted ' + event.deleted + ' of ' + event.total + ' files.';
+                    }
+                });
             }
         }
     </script>
@@ -0,0 +1,99 @@
+# Microbenchmark for the JSON codec: synthetic webhook updates and Bot API payloads run through
+# the stdlib path the app used before and through json_dumps/json_loads/FastJSONProvider.
+#
+#   python benchmarks/json_codec.py [updates]
+import os
+import sys
+import json
+import random
+import timeit
+
+os.environ.setdefault('TOKEN', 'bench-token')
+os.environ.setdefault('SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.bench-snapshot-unused'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import index
+
+CAPTIONS = ["quarterly report", "holiday photos 🌴", "Лекция 3 — конспект", "会议记录", "build logs", ""]
+MENU = [
+    {"text": "📤 Upload File", "callback_data": "upload_instructions"},
+    {"text": "📂 My Files", "callback_data": "myfiles_0"},
+    {"text": "ℹ️ Help", "callback_data": "help"},
+    {"text": "🔒 Privacy", "callback_data": "privacy"}
+]
+
+def sender(rng):
+    user_id = rng.randrange(10 ** 8, 10 ** 10)
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"user{user_id}", "language_code": "en"}
+
+def make_update(rng, update_id):
+    user = sender(rng)
+    message = {"message_id": update_id, "date": 1700000000 + update_id, "from": user, "chat": {"id": user["id"], "type": "private", "first_name": "Bench"}}
+    kind = rng.choice(["text", "document", "photo", "callback_query", "inline_query"])
+    if kind == "text":
+        message["text"] = rng.choice(["/start", "/help", "/myfiles", "/privacy"])
+        return {"update_id": update_id, "message": message}
+    if kind == "document":
+        message["document"] = {"file_name": "report.pdf", "mime_type": "application/pdf", "file_id": f"BQACAgIAAxkBAAI{update_id:012d}", "file_unique_id": f"AgAD{update_id:08d}", "file_size": rng.randrange(1, 2 ** 31)}
+        message["caption"] = rng.choice(CAPTIONS)
+        return {"update_id": update_id, "message": message}
+    if kind == "photo":
+        message["photo"] = [{"file_id": f"AgACAgIAAxkBAAI{update_id:010d}{size}", "file_unique_id": f"AQAD{update_id:06d}{size}", "file_size": size * 9000, "width": size * 90, "height": size * 60} for size in (1, 4, 9, 14)]
+        return {"update_id": update_id, "message": message}
+    if kind == "callback_query":
+        message["from"] = {"id": 1, "is_bot": True, "first_name": "Uploader", "username": index.BOT_USERNAME}
+        message["text"] = "📂 Your Files (12 total)"
+        message["reply_markup"] = index.create_inline_keyboard(MENU)
+        return {"update_id": update_id, "callback_query": {"id": str(update_id * 7919), "from": user, "message": message, "chat_instance": str(update_id), "data": rng.choice(["help", "main_menu", "myfiles_1", f"delete_{update_id}"])}}
+    return {"update_id": update_id, "inline_query": {"id": str(update_id * 104729), "from": user, "query": rng.choice(CAPTIONS), "offset": ""}}
+
+def make_outbound(rng, count):
+    # Each payload paired with the dict form the stdlib path sent through requests' json=
+    payloads = []
+    for i in range(count):
+        chat_id = rng.randrange(10 ** 8, 10 ** 10)
+        if i % 3 == 2:
+            results = [{"type": "document", "id": str(n), "document_file_id": f"BQACAgIAAxkBAAI{n:012d}", "title": rng.choice(CAPTIONS) or "Document", "description": "1.50 MB"} for n in range(index.INLINE_PAGE_SIZE)]
+            payload = {"inline_query_id": str(i), "results": results, "cache_time": index.INLINE_CACHE_TIME, "is_personal": True, "next_offset": "20"}
+            payloads.append((payload, payload))
+        else:
+            text = f"📂 <b>Your Files</b> ({i} total)\n\n" + "1. <b>Document</b> | 📅 2026-10-19 10:00 | 📏 1.50 MB\n" * 5
+            payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
+            payloads.append((dict(payload, reply_markup=index.create_inline_keyboard(MENU)), dict(payload, reply_markup=index.cached_markup("bench_menu", MENU))))
+    return payloads
+
+def jsonify_body(app):
+    # The real response path: jsonify passes separators/indent/sort_keys through to the provider
+    def encode(pair):
+        with app.app_context():
+            return jsonify(pair[1]).get_data()
+    return encode
+
+def per_op(func, items):
+    runs = timeit.repeat(lambda: [func(item) for item in items], number=1, repeat=5)
+    return min(runs) / len(items) * 1e6
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    updates = [json.dumps(make_update(rng, n)).encode('utf-8') for n in range(1, count + 1)]
+    outbound = make_outbound(rng, count)
+    stdlib_provider = DefaultJSONProvider(index.app)
+    stdlib_app = Flask("stdlib")
+
+    cases = [
+        ("decode webhook update", per_op(json.loads, updates), per_op(index.json_loads, updates)),
+        ("encode Bot API payload", per_op(lambda pair: json.dumps(pair[0], allow_nan=False).encode('utf-8'), outbound), per_op(lambda pair: index.json_dumps(pair[1]), outbound)),
+        ("Flask request.get_json", per_op(stdlib_provider.loads, updates), per_op(index.app.json.loads, updates)),
+        ("Flask jsonify body", per_op(jsonify_body(stdlib_app), outbound), per_op(jsonify_body(index.app), outbound))
+    ]
+    print(f"{count} updates, {count} outbound payloads, codec backend: {'orjson' if index.orjson else 'stdlib json'}")
+    print(f"{'case':<26}{'stdlib µs/op':>14}{'codec µs/op':>14}{'speedup':>10}")
+    for name, before, after in cases:
+        print(f"{name:<26}{before:>14.2f}{after:>14.2f}{before / after:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# Soak test: drives synthetic uploads, commands and deletes through the Flask test client
+# against a stub Bot API and fails if memory retained per idle user or per deleted file grows.
+# Opt-in, since a default run takes a couple of minutes:
+#
+#   SOAK_CYCLES=5000 python -m pytest -q tests/soak_test.py
+#   SOAK_CYCLES=1000000 python tests/soak_test.py    # full-length run
+import os
+import sys
+import gc
+import time
+import types
+import tracemalloc
+
+import pytest
+
+if __name__ != '__main__' and not os.getenv('SOAK_CYCLES'):
+    pytest.skip("soak test is opt-in: set SOAK_CYCLES to run it", allow_module_level=True)
+
+os.environ.setdefault('TOKEN', 'soak-test-token')
+os.environ.setdefault('SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.soak-snapshot-unused'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import index
+
+SOAK_CYCLES = int(os.getenv('SOAK_CYCLES', 5000))  # Upload/delete cycles per measured phase
+WARMUP_CYCLES = 2000  # Past the expiry heap's compaction slack and the first dict resizes
+SOAK_INTERVAL = int(os.getenv('SOAK_INTERVAL', 5000))  # Cycles between tracemalloc samples
+USER_POOL = 1000  # Returning users in the deleted-file phase
+MAX_BYTES_PER_IDLE_USER = int(os.getenv('SOAK_MAX_BYTES_PER_IDLE_USER', 64))
+MAX_BYTES_PER_DELETED_FILE = int(os.getenv('SOAK_MAX_BYTES_PER_DELETED_FILE', 32))
+
+class StubResponse:
+    status_code = 200
+    text = '{"ok":true}'
+
+    def __init__(self, result):
+        self.content = index.json_dumps({"ok": True, "result": result})
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return index.json_loads(self.content)
+
+class StubBotAPI:
+    def __init__(self):
+        self.message_id = 0
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        self.message_id += 1
+        return StubResponse({"message_id": self.message_id, "chat": {"id": 1}})
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return StubResponse(True)
+
+class Clock:
+    # Synthetic traffic is far denser than real traffic, so time moves by a fixed step per
+    # cycle; that lets rate limits pass and idle users age out of the sweeps.
+    def __init__(self, step):
+        self.now = time.time()
+        self.step = step
+
+    def time(self):
+        return self.now
+
+    def tick(self):
+        self.now += self.step
+
+class Soak:
+    def __init__(self):
+        self.saved = {"time": index.time, "post": index.http.__dict__.get("post"), "get": index.http.__dict__.get("get")}
+        self.api = StubBotAPI()
+        index.http.post = self.api.post
+        index.http.get = self.api.get
+        self.clock = Clock(step=0.5)
+        index.time = types.SimpleNamespace(time=self.clock.time, perf_counter=time.perf_counter, sleep=time.sleep)
+        self.client = index.app.test_client()
+        self.client.environ_base["HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN"] = index.WEBHOOK_SECRET
+        self.update_id = 0
+        self.next_user = 10 ** 9
+        self.samples = []
+
+    def close(self):
+        # Put back the module's clock and the session's own methods for any test that runs after
+        index.time = self.saved["time"]
+        for name in ["post", "get"]:
+            if self.saved[name] is None:
+                index.http.__dict__.pop(name, None)
+            else:
+                setattr(index.http, name, self.saved[name])
+
+    def send(self, field, payload):
+        self.update_id += 1
+        response = self.client.post('/webhook', json={"update_id": self.update_id, field: payload})
+        assert response.status_code == 200, response.data
+
+    def message(self, user_id, **fields):
+        self.send("message", dict({"message_id": self.update_id, "date": int(self.clock.now), "chat": {"id": user_id}, "from": {"id": user_id, "first_name": "Soak"}}, **fields))
+
+    def cycle(self, user_id):
+        self.message(user_id, text="/start")
+        self.message(user_id, document={"file_id": f"F{self.update_id}", "file_unique_id": f"U{self.update_id}", "file_size": 1024, "file_name": "soak.bin"}, caption="soak test file")
+        self.message(user_id, text="/myfiles")
+        owned = list(index.user_files.get(user_id, {}))
+        assert owned, f"upload from {user_id} was not registered"
+        self.send("callback_query", {"id": str(self.update_id), "from": {"id": user_id}, "data": f"delete_{owned[-1]}", "message": {"message_id": self.update_id, "chat": {"id": user_id}}})
+        self.clock.tick()
+
+    def new_user(self):
+        self.next_user += 1
+        return self.next_user
+
+    def retained(self):
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+
+    def run(self, cycles, pick_user):
+        # Returns bytes retained over the phase; samples are kept for the failure report
+        started = self.retained()
+        for i in range(1, cycles + 1):
+            self.cycle(pick_user(i))
+            if i % SOAK_INTERVAL == 0:
+                self.samples.append((i, self.retained() - started))
+        # Let the last users go idle, then tap a button so the next request runs the sweep
+        self.clock.now += 2 * max(index.ACTIVITY_SWEEP_SECONDS, 60)
+        user_id = self.new_user()
+        self.send("callback_query", {"id": str(self.update_id), "from": {"id": user_id}, "data": "help", "message": {"message_id": self.update_id, "chat": {"id": user_id}}})
+        return self.retained() - started
+
+def report(title, before, after, limit=10):
+    lines = [title]
+    for stat in after.compare_to(before, 'lineno')[:limit]:
+        lines.append(f"  {stat}")
+    return "\n".join(lines)
+
+def test_memory_does_not_grow_with_idle_users_or_deleted_files():
+    tracemalloc.start()
+    soak = Soak()
+    try:
+        # Warm-up fills the bounded caches (markup_cache, expiry_heap slack, registry dict capacity)
+        soak.run(WARMUP_CYCLES, lambda i: soak.new_user())
+
+        before = tracemalloc.take_snapshot()
+        idle_growth = soak.run(SOAK_CYCLES, lambda i: soak.new_user())
+        after = tracemalloc.take_snapshot()
+        per_idle_user = idle_growth / SOAK_CYCLES
+        assert per_idle_user <= MAX_BYTES_PER_IDLE_USER, report(
+            f"{per_idle_user:.1f} bytes retained per idle user (limit {MAX_BYTES_PER_IDLE_USER}), samples {soak.samples}", before, after)
+
+        pool = [soak.new_user() for _ in range(USER_POOL)]
+        soak.samples = []
+        before = tracemalloc.take_snapshot()
+        file_growth = soak.run(SOAK_CYCLES, lambda i: pool[i % USER_POOL])
+        after = tracemalloc.take_snapshot()
+        per_deleted_file = file_growth / SOAK_CYCLES
+        assert per_deleted_file <= MAX_BYTES_PER_DELETED_FILE, report(
+            f"{per_deleted_file:.1f} bytes retained per deleted file (limit {MAX_BYTES_PER_DELETED_FILE}), samples {soak.samples}", before, after)
+
+        assert not index.uploaded_files and not index.user_activity
+        print(f"{per_idle_user:.1f} bytes per idle user, {per_deleted_file:.1f} bytes per deleted file, {soak.api.calls} Bot API calls")
+    finally:
+        soak.close()
+        tracemalloc.stop()
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    test_memory_does_not_grow_with_idle_users_or_deleted_files()
+    print(f"soak passed: {WARMUP_CYCLES + 2 * SOAK_CYCLES} cycles in {time.perf_counter() - started:.1f} s")